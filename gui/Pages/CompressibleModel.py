@@ -58,6 +58,10 @@ class CompressibleModel(Variables, Model):
     Active de compressible model
     There is three different thermodynamic law
     """
+    COMP_CHOICE = ('off', 'constant_gamma', 'variable_gamma', 'van_der_waals')
+    VAR_LIST    = ('temperature',)
+    _DEFAULTS   = {'activation': 'off'}
+
     def __init__(self, case):
         """
         Constuctor.
@@ -71,19 +75,6 @@ class CompressibleModel(Variables, Model):
         self.node_fluid  = self.node_prop.xmlInitNode('fluid_properties')
         self.node_ref    = self.node_thermo.xmlInitNode('reference_values')
 
-        self.comp_choice = ['off', 'constant_gamma', 'variable_gamma', 'van_der_waals']
-        self.var_list   = ['temperature']
-
-
-    def _defaultCompressibleValues(self):
-        """
-        Return in a dictionnary which contains default values
-        """
-        default = {}
-        default['activation'] = "off"
-
-        return default
-
 
     @Variables.undoGlobal
     def setCompressibleModel(self, model):
@@ -91,29 +82,32 @@ class CompressibleModel(Variables, Model):
         Active or desactive the compressible model
         Add and remove the variables and properties associated
         """
-        self.isInList(model, self.comp_choice)
         oldModel = self.node_comp['model']
-        if oldModel != model:
-            self.node_comp['model'] = model
-            if model == 'off':
-                for zone in LocalizationModel('BoundaryZone', self.case).getZones():
-                    if zone.getNature() == "outlet":
-                        Boundary("compressible_outlet", zone.getLabel(), self.case).deleteCompressibleOutlet()
-                    if zone.getNature() == "inlet":
-                        Boundary("inlet", zone.getLabel(), self.case).deleteCompressibleInlet()
-                self.__removeVariablesAndProperties()
-                self.node_np.xmlRemoveChild('hydrostatic_equilibrium')
-                self.node_fluid.xmlRemoveChild('property', name = 'volume_viscosity')
-                self.node_ref.xmlRemoveChild('mass_molar')
-                self.node_ref.xmlRemoveChild('temperature')
-                ThermalScalarModel(self.case).setThermalModel('off')
-            else :
-                ThermalScalarModel(self.case).setThermalModel('total_energy')
-                for v in self.var_list:
-                    self.setNewVariable(self.node_comp, v, tpe="model", label=v)
-                from code_saturne.Pages.TurbulenceModel import TurbulenceModel
-                TurbulenceModel(self.case).setTurbulenceModel('off')
-                del TurbulenceModel
+        if oldModel == model:
+            return
+
+        self.isInList(model, CompressibleModel.COMP_CHOICE)
+        self.node_comp['model'] = model
+        if model == 'off':
+            for zone in LocalizationModel('BoundaryZone', self.case).getZones():
+                nature = zone.getNature()
+                if nature == "outlet":
+                    Boundary("compressible_outlet", zone.getLabel(), self.case).deleteCompressibleOutlet()
+                elif nature == "inlet":
+                    Boundary("inlet", zone.getLabel(), self.case).deleteCompressibleInlet()
+            self.__removeVariablesAndProperties()
+            self.node_np.xmlRemoveChild('hydrostatic_equilibrium')
+            self.node_fluid.xmlRemoveChild('property', name = 'volume_viscosity')
+            self.node_ref.xmlRemoveChild('mass_molar')
+            self.node_ref.xmlRemoveChild('temperature')
+            ThermalScalarModel(self.case).setThermalModel('off')
+        else :
+            ThermalScalarModel(self.case).setThermalModel('total_energy')
+            for v in CompressibleModel.VAR_LIST:
+                self.setNewVariable(self.node_comp, v, tpe="model", label=v)
+            from code_saturne.Pages.TurbulenceModel import TurbulenceModel
+            TurbulenceModel(self.case).setTurbulenceModel('off')
+            del TurbulenceModel
 
 
     @Variables.noUndo
@@ -121,10 +115,9 @@ class CompressibleModel(Variables, Model):
         """
         Return the model of the compressible
         """
-        node = self.node_thermo.xmlInitNode('compressible_model')
-        status = node['model']
-        if status not in self.comp_choice:
-            status = self._defaultCompressibleValues()['activation']
+        status = self.node_comp['model']
+        if status not in CompressibleModel.COMP_CHOICE:
+            status = CompressibleModel._DEFAULTS['activation']
             self.setCompressibleModel(status)
         return status
 
@@ -133,7 +126,7 @@ class CompressibleModel(Variables, Model):
         """
         Delete variables and property that are useless accordingly to the model.
         """
-        for v in self.var_list:
+        for v in CompressibleModel.VAR_LIST:
             self.node_comp.xmlRemoveChild('variable', name=v)
 
 
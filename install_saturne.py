@@ -15,9 +15,19 @@ if platform.system == 'Windows':
     sys.stderr.write("This script only works on Unix-like platforms\n")
 
 import os, shutil
-import string
+import hashlib
+import shlex
 import subprocess
-import types, string, re, fnmatch
+import threading
+import time
+import traceback
+import string
+import types, re, fnmatch
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 #-------------------------------------------------------------------------------
 # Global variable
@@ -25,58 +35,305 @@ import types, string, re, fnmatch
 
 verbose = 'yes'
 
+# Lock for main log file output, which is shared by concurrent installs
+log_lock = threading.Lock()
+
+# Setup file keywords, with associated Setup attribute and values
+# for which the attribute's current value is kept
+setup_keywords = {'download': ('download', []),
+                  'prefix': ('prefix', ['default', 'auto']),
+                  'debug': ('debug', []),
+                  'make_jobs': ('make_jobs', ['default', 'auto']),
+                  'language': ('language', []),
+                  'use_arch': ('use_arch', []),
+                  'arch': ('arch', []),
+                  'compCxx': ('cxx', ['default', 'auto']),
+                  'compC': ('cc', []),
+                  'compF': ('fc', []),
+                  'mpiCompC': ('mpicc', ['default', 'auto']),
+                  'mpiCompCxx': ('mpicxx', ['default', 'auto']),
+                  'disable_gui': ('disable_gui', []),
+                  'disable_frontend': ('disable_frontend', []),
+                  'python': ('python', ['default', 'auto']),
+                  'salome': ('salome', ['default', 'auto', 'no'])}
+
+# Cache for command lookups
+which_cache = {}
+
+# Commands being run, and flag preventing new commands from being run
+running_commands = []
+commands_lock = threading.Lock()
+commands_abort = threading.Event()
+
+#-------------------------------------------------------------------------------
+# Setup file templates
+#-------------------------------------------------------------------------------
+
+setup_main = string.Template(\
+"""#========================================================
+# Setup file for Code_Saturne installation
+#========================================================
+#
+#--------------------------------------------------------
+# Download packages ?
+#--------------------------------------------------------
+download  $download
+#
+#--------------------------------------------------------
+# Language
+#   default: "en" english
+#   others:  "fr" french
+#--------------------------------------------------------
+language  $lang
+#
+#--------------------------------------------------------
+# Install Code_Saturne with debugging symbols
+#--------------------------------------------------------
+debug     $debug
+#
+#--------------------------------------------------------
+# Number of parallel jobs used for compilation
+#   default: "auto" (processors shared among the
+#            packages built simultaneously)
+#--------------------------------------------------------
+make_jobs  $make_jobs
+#
+#--------------------------------------------------------
+# Installation directory
+#--------------------------------------------------------
+prefix    $prefix
+#
+#--------------------------------------------------------
+# Optional architecture Name (installation subdirectory)
+#--------------------------------------------------------
+use_arch  $use_arch
+arch      $arch
+#
+#--------------------------------------------------------
+# C compiler and optional MPI wrapper
+#--------------------------------------------------------
+compC     $cc
+mpiCompC  $mpicc
+#
+#--------------------------------------------------------
+# Fortran compiler
+#--------------------------------------------------------
+compF    $fc
+#
+#--------------------------------------------------------
+# C++ compiler and MPI wrapper for optional packages
+#
+# Required only for static builds using the MED library
+# or for build of optional modules such as MEDCoupling
+# support.
+#--------------------------------------------------------
+compCxx     $cxx
+mpiCompCxx  $mpicxx
+#
+#--------------------------------------------------------
+# Python interpreter.
+#--------------------------------------------------------
+python    $python
+#
+#--------------------------------------------------------
+# Disable the Graphical user Interface ?
+#--------------------------------------------------------
+disable_gui  $disable_gui
+#
+#--------------------------------------------------------
+# Disable frontend (also disables GUI) ?
+# May be useful for debug builds and HPC cluster builds
+# installed side-by side with a full build.
+#--------------------------------------------------------
+disable_frontend  $disable_frontend
+#
+#--------------------------------------------------------
+# Optional SALOME platform install path.
+#
+# This is the path for the main SALOME directory,
+# not the application directory.
+#
+# If Code_Saturne is built with SALOME support,
+# running "code_saturne salome" will launch the
+# associated application, containing the CFDSTUDY module.
+#--------------------------------------------------------
+salome    $salome
+#
+#--------------------------------------------------------
+# Optional packages:
+# ------------------
+#
+# MED / HDF5  For MED file format support
+#             (used by SALOME and by Gmsh)
+#
+# CGNS / HDF5 For CGNS file support
+#             (used by many meshing tools)
+#
+# Scotch (includes PT-Scotch) and/or ParMetis
+# for parallel partitioning
+#
+#   For Linux workstations, HDF5, CGNS, and even MED
+# packages may be available through the package manager.
+# HDF5 is also often available on large systems.
+# When building with SALOME, the platform distribution's
+# packages may be used, by setting 'salome' in the
+# matching entry under the "Use" column.
+#
+# Scotch and Pt-Scotch are available in some Linux
+# distributions, but may be built with options
+# incompatible with non-threaded Code_Saturne runs.
+#
+#   To install CGNS or ParMetis, the CMake
+# configuration/installation tool is required
+# (it is available in most Linux distributions)
+#
+#   Libxml2 is needed to read XML files output by the
+# Graphical User Interface. It is generally available
+# through the package manager.
+#
+#   Libraries already built with the same options are
+# not rebuilt; set "Install" to "force" to rebuild them.
+#--------------------------------------------------------
+#
+#  Name    Use   Install  Path
+#
+""")
+
+setup_lib = "{lib:<9}  {use:<4}  {install:<3}      {dir}\n"
+
+setup_end = \
+"""#
+#========================================================
+"""
+
 #-------------------------------------------------------------------------------
 # Global methods
 #-------------------------------------------------------------------------------
 
-def run_command(cmd, stage, app, log):
+def run_command(cmd, stage, app, log, cwd=None, abort=True):
     """
-    Run a command via the subprocess module.
+    Run a command (given as an argument list, without using a shell)
+    via the subprocess module, its output being written to the log file.
+
+    If abort is False, a failure is not fatal, and the command's
+    return code is returned.
+
+    Once terminate_commands() has been called, commands are not run
+    anymore, and are considered as failed.
     """
 
+    if commands_abort.is_set():
+        sys.exit(1)
+
     if verbose == 'yes':
-        sys.stdout.write("   o " + stage + "...\n")
+        sys.stdout.write("   o " + stage + " (" + app + ")...\n")
+
+    log.flush()
+
+    try:
+        p = subprocess.Popen(cmd,
+                             cwd=cwd,
+                             stdout=log,
+                             stderr=subprocess.STDOUT)
+    except OSError:
+        log.write("%s: %s\n" % (cmd[0], sys.exc_info()[1]))
+        log.flush()
+        returncode = 127
+    else:
+        commands_lock.acquire()
+        running_commands.append(p)
+        commands_lock.release()
+        if commands_abort.is_set():
+            p.terminate()
+        returncode = p.wait()
+        commands_lock.acquire()
+        running_commands.remove(p)
+        commands_lock.release()
+
+    if returncode != 0 and abort:
+        if not commands_abort.is_set():
+            sys.stderr.write("Error during " + stage.lower() +
+                             " stage of " + app + ".\n")
+            sys.stderr.write("See " + log.name + " for more information.\n")
+        sys.exit(1)
 
-    p = subprocess.Popen(cmd,
-                         shell=True,
-                         universal_newlines=True,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.STDOUT)
+    return returncode
 
-    output = p.communicate()
-    log.write(output[0])
+#-------------------------------------------------------------------------------
 
-    if p.returncode != 0:
-        sys.stderr.write("Error during " + stage.lower() +
-                         " stage of " + app + ".\n")
-        sys.stderr.write("See " + log.name + " for more information.\n")
-        sys.exit(1)
+def terminate_commands():
+    """
+    Terminate commands being run, and prevent new ones from being run.
+    """
+
+    commands_lock.acquire()
+    try:
+        commands_abort.set()
+        for p in running_commands:
+            try:
+                p.terminate()
+            except OSError:
+                pass
+    finally:
+        commands_lock.release()
+
+#-------------------------------------------------------------------------------
+
+def abort_setup(message, hint="Please check your setup file."):
+    """
+    Print an error message and abort the installation.
+    """
+
+    sys.stderr.write("\n*** Aborting installation:\n"
+                     + message + "\n" + hint + "\n\n")
+    sys.exit(1)
+
+#-------------------------------------------------------------------------------
+
+def which(cmd):
+    """
+    Return the path of a given command, or None if not found.
+    """
+
+    if cmd in which_cache:
+        return which_cache[cmd]
+
+    path = None
+    if os.path.dirname(cmd):
+        if os.path.isfile(cmd) and os.access(cmd, os.X_OK):
+            path = cmd
+    else:
+        for d in os.getenv('PATH', '').split(os.pathsep):
+            absname = os.path.join(d, cmd)
+            if os.path.isfile(absname) and os.access(absname, os.X_OK):
+                path = absname
+                break
+
+    which_cache[cmd] = path
+
+    return path
 
 #-------------------------------------------------------------------------------
 
 def run_test(cmd):
     """
-    Run a test for a given command via the subprocess module.
+    Test if a given command is available.
     """
 
     if verbose == 'yes':
         sys.stdout.write("   o Checking for " + os.path.basename(cmd) + "...  ")
 
-    cmd = "type " + cmd
+    path = which(cmd)
 
-    p = subprocess.Popen(cmd,
-                         shell=True,
-                         universal_newlines=True,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.STDOUT)
-
-    output = p.communicate()
     if verbose == 'yes':
-        if p.returncode == 0: log_str = output[0].split()[2]
+        if path: log_str = path
         else: log_str = "not found"
         sys.stdout.write("%s\n" % log_str)
 
-    return p.returncode
+    if path:
+        return 0
+    else:
+        return 1
 
 #-------------------------------------------------------------------------------
 
@@ -161,6 +418,130 @@ def find_executable(names, env_var=None):
                         return name
     return None
 
+#-------------------------------------------------------------------------------
+
+def make_dirs(path):
+    """
+    Create a directory and its parents, if not already present.
+    """
+
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+#-------------------------------------------------------------------------------
+
+def clone_tree(src, dst):
+    """
+    Replicate a directory tree, using hard links instead of copies for
+    files (which are copied only when they cannot be linked, for example
+    across file systems).
+
+    Files of the new tree must be replaced rather than modified in place,
+    as the original files would be modified also.
+    """
+
+    for root, dirs, files in os.walk(src):
+
+        dst_root = os.path.join(dst, os.path.relpath(root, src))
+        dst_root = os.path.normpath(dst_root)
+        os.makedirs(dst_root)
+        shutil.copymode(root, dst_root)
+
+        for name in dirs + files:
+            src_path = os.path.join(root, name)
+            dst_path = os.path.join(dst_root, name)
+            if os.path.islink(src_path):
+                os.symlink(os.readlink(src_path), dst_path)
+            elif name in files:
+                try:
+                    os.link(src_path, dst_path)
+                except OSError:
+                    shutil.copy2(src_path, dst_path)
+
+        # Symbolic links to directories are not followed
+        dirs[:] = [d for d in dirs if not os.path.islink(os.path.join(root, d))]
+
+#-------------------------------------------------------------------------------
+
+def cpu_count():
+    """
+    Return the number of available processors.
+    """
+
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except Exception:
+        return 1
+
+#-------------------------------------------------------------------------------
+
+def run_parallel(tasks, dependencies, function, max_workers,
+                 on_failure=None):
+    """
+    Call function(task) for each given task, each in its own thread.
+
+    At most max_workers tasks run simultaneously, and a task is started
+    only once the tasks it depends upon (among those given) have succeeded.
+    A task fails if function raises an exception or exits.
+
+    If on_failure is given, on_failure(task) is called when a task fails,
+    and no new task is started afterwards.
+
+    Return the list of tasks which failed or were not run.
+    """
+
+    status = {}
+    running = []
+    waiting = list(tasks)
+    cond = threading.Condition()
+
+    def worker(task):
+        success = False
+        try:
+            try:
+                function(task)
+                success = True
+            except SystemExit:
+                pass
+            except Exception:
+                traceback.print_exc()
+            if not success and on_failure:
+                on_failure(task)
+        finally:
+            cond.acquire()
+            status[task] = success
+            running.remove(task)
+            cond.notify()
+            cond.release()
+
+    cond.acquire()
+    try:
+        while waiting or running:
+            for task in list(waiting):
+                deps = [d for d in dependencies.get(task, []) if d in tasks]
+                if on_failure and False in status.values():
+                    waiting.remove(task)
+                    status[task] = False
+                elif [d for d in deps if status.get(d) == False]:
+                    waiting.remove(task)
+                    status[task] = False
+                elif len(running) < max_workers \
+                        and [d for d in deps if not status.get(d)] == []:
+                    waiting.remove(task)
+                    running.append(task)
+                    t = threading.Thread(target=worker, args=(task,))
+                    t.start()
+            if running:
+                cond.wait()
+    finally:
+        cond.release()
+
+    return [task for task in tasks if not status[task]]
+
 #-------------------------------------------------------------------------------
 # Class definition for a generic package
 #-------------------------------------------------------------------------------
@@ -189,27 +570,28 @@ class Package:
         self.installation = 'no'
         self.source_dir = None
         self.install_dir = None
-        self.config_opts = ''
+        self.config_opts = []
         self.log_file = sys.stdout
         self.cxx = None
         self.cc = None
         self.fc = None
+        self.make_jobs = 1
         self.vpath_support = True
         self.create_install_dirs = False
+        self.dependencies = []
 
     #---------------------------------------------------------------------------
 
     def set_version_from_configure(self, path):
-        f = open(path)
-        for l in f:
-            if not self.version and l[0:15] == 'PACKAGE_VERSION':
-                sep = l[16] # quote is usually ', but could be "
-                try:
-                    self.version = l.split(sep)[1]
-                    break
-                except Exception:
-                    pass
-        f.close()
+        with open(path) as f:
+            for l in f:
+                if not self.version and l[0:15] == 'PACKAGE_VERSION':
+                    sep = l[16] # quote is usually ', but could be "
+                    try:
+                        self.version = l.split(sep)[1]
+                        break
+                    except Exception:
+                        pass
 
     #---------------------------------------------------------------------------
 
@@ -227,23 +609,105 @@ class Package:
                             'vers':self.version, 'url':self.url,
                             'pack':self.package,
                             'src':self.source_dir, 'inst':self.install_dir,
-                            'opts':self.config_opts})
+                            'opts':self.config_opts_str()})
 
     #---------------------------------------------------------------------------
 
-    def download(self):
+    def config_opts_str(self):
 
-        if sys.version_info[0] < (3):
-            import urllib2
-            u = urllib2.urlopen(self.url)
-            data = u.read()
-            f = open(self.archive, 'wb')
-            f.write(data)
-            f.close()
+        # Configuration options as a single string (for display and keys)
+
+        return ' '.join(self.config_opts)
+
+    #---------------------------------------------------------------------------
+
+    def install_key(self):
+
+        # Key identifying the package version and build options
+
+        desc = ' '.join([str(x) for x in [self.package, self.version,
+                                          self.config_opts_str(),
+                                          self.cc, self.cxx, self.fc]])
+        return hashlib.sha256(desc.encode('utf-8')).hexdigest()
+
+    #---------------------------------------------------------------------------
+
+    def check_install_stamp(self):
+
+        # Check if the package was already installed with the same options
+
+        if not self.install_dir:
+            return False
+
+        try:
+            with open(os.path.join(self.install_dir, '.install_stamp')) as f:
+                key = f.read().strip()
+        except IOError:
+            return False
 
+        return key == self.install_key()
+
+    #---------------------------------------------------------------------------
+
+    def write_install_stamp(self):
+
+        with open(os.path.join(self.install_dir, '.install_stamp'), 'w') as f:
+            f.write(self.install_key() + '\n')
+
+    #---------------------------------------------------------------------------
+
+    def download(self, retries=3):
+
+        # Keep a complete archive from a previous run (interrupted
+        # downloads only leave a temporary file).
+
+        if os.path.isfile(self.archive) and os.path.getsize(self.archive) > 0:
+            sys.stdout.write("Using already downloaded %s\n" % self.archive)
+            return
+
+        if sys.version_info[0] < (3):
+            from urllib2 import urlopen
         else:
-            import urllib.request
-            urllib.request.urlretrieve(self.url, self.archive)
+            from urllib.request import urlopen
+
+        # Stream archive to a temporary file, so that an interrupted
+        # download is not mistaken for a complete one, retrying with
+        # increasing delays in case of (possibly transient) network errors.
+
+        part = self.archive + '.part'
+
+        delay = 1
+        for i in range(retries + 1):
+            try:
+                u = urlopen(self.url)
+                try:
+                    with open(part, 'wb') as f:
+                        while True:
+                            if commands_abort.is_set():
+                                sys.exit(1)
+                            data = u.read(1 << 20)
+                            if not data:
+                                break
+                            f.write(data)
+                finally:
+                    u.close()
+                break
+            except SystemExit:
+                if os.path.isfile(part):
+                    os.remove(part)
+                raise
+            except (IOError, OSError):
+                if os.path.isfile(part):
+                    os.remove(part)
+                if i == retries:
+                    sys.stderr.write("Error downloading " + self.url + ".\n")
+                    sys.exit(1)
+                time.sleep(delay)
+                delay *= 2
+
+        if os.path.isfile(self.archive):
+            os.remove(self.archive)
+        os.rename(part, self.archive)
 
     #---------------------------------------------------------------------------
 
@@ -258,22 +722,48 @@ class Package:
                 sys.exit(1)
 
             zip = zipfile.ZipFile(self.archive)
+            members = zip.infolist()
 
-            relative_source_dir = zip.namelist()[0].split(os.path.sep)[0]
+            relative_source_dir = members[0].filename.split(os.path.sep)[0]
             self.source_dir = os.path.abspath(relative_source_dir)
 
-            zip.close()
-
-            # Use external unzip command so as to keep file properties
+            # Create directories first, so that files may then be
+            # extracted concurrently, each worker using its own handle.
+
+            files = []
+            dirs = set()
+            for info in members:
+                if info.filename[-1:] == '/':
+                    zip.extract(info)
+                    continue
+                parts = [d for d in info.filename.split('/')[:-1]
+                         if d not in ['', '.', '..']]
+                if parts:
+                    d = os.path.join(*parts)
+                    if d not in dirs:
+                        make_dirs(d)
+                        dirs.add(d)
+                files.append(info)
 
-            p = subprocess.Popen('unzip ' + self.archive,
-                                 shell=True,
-                                 universal_newlines=True,
-                                 stdout=sys.stdout,
-                                 stderr=sys.stderr)
-            output = p.communicate()
+            zip.close()
 
-            if p.returncode != 0:
+            def extract_files(i):
+                z = zipfile.ZipFile(self.archive)
+                try:
+                    for info in files[i::n_workers]:
+                        path = z.extract(info)
+                        # Keep file properties, as the unzip command does
+                        mode = (info.external_attr >> 16) & 0o777
+                        if mode:
+                            os.chmod(path, mode)
+                finally:
+                    z.close()
+
+            n_workers = max(1, min(cpu_count(), len(files)))
+            failed = run_parallel(list(range(n_workers)), {}, extract_files,
+                                  n_workers)
+
+            if failed:
                 sys.stderr.write("Error unzipping file " + self.archive + ".\n")
                 sys.exit(1)
 
@@ -285,26 +775,78 @@ class Package:
                 sys.stderr.write("%s is not a tar archive\n" % self.archive)
                 sys.exit(1)
 
-            tar = tarfile.open(self.archive)
+            # Use parallel decompression tools when available, reading
+            # their output as a stream.
 
-            first_member = tar.next()
-            relative_source_dir = first_member.name.split(os.path.sep)[0]
-            self.source_dir = os.path.abspath(relative_source_dir)
+            decompressor = None
+            if self.archive[-3:] == '.gz' or self.archive[-4:] == '.tgz':
+                decompressor = find_executable(['pigz'])
+            elif self.archive[-4:] == '.bz2' or self.archive[-5:] == '.tbz2':
+                decompressor = find_executable(['pbzip2'])
+
+            p = None
+            if decompressor:
+                p = subprocess.Popen([decompressor, '-dc', self.archive],
+                                     stdout=subprocess.PIPE)
+
+            # Always close the stream and wait for the decompressor,
+            # even if the archive is corrupt.
 
             try:
-                tar.extractall()
-            except AttributeError:
-                for tarinfo in tar:
-                    tar.extract(tarinfo)
+                if p:
+                    tar = tarfile.open(fileobj=p.stdout, mode='r|')
+                else:
+                    tar = tarfile.open(self.archive)
+                try:
+                    first_member = tar.next()
+                    relative_source_dir \
+                        = first_member.name.split(os.path.sep)[0]
+                    self.source_dir = os.path.abspath(relative_source_dir)
+                    tar.extractall()
+                finally:
+                    tar.close()
+            finally:
+                if p:
+                    p.stdout.close()
+                    returncode = p.wait()
+
+            if p and returncode != 0:
+                sys.stderr.write("Error decompressing file "
+                                 + self.archive + ".\n")
+                sys.exit(1)
+
+    #---------------------------------------------------------------------------
 
-            tar.close()
+    def run_make(self, args, stage, cwd):
+
+        # Compile using parallel jobs, falling back to a serial build
+        # for makefiles which do not support them.
+
+        if self.make_jobs > 1:
+            ret = run_command(['make', '-j%d' % self.make_jobs] + args,
+                              stage, self.name, self.log_file, cwd,
+                              abort=False)
+            if ret == 0:
+                return
+            # Do not retry if the build was interrupted (aborted
+            # installation or make killed by a signal).
+            if commands_abort.is_set():
+                sys.exit(1)
+            if ret < 0:
+                sys.stderr.write("Error during " + stage.lower() +
+                                 " stage of " + self.name + ".\n")
+                sys.stderr.write("See " + self.log_file.name +
+                                 " for more information.\n")
+                sys.exit(1)
+            sys.stdout.write("   o Retrying serial " + stage.lower()
+                             + " (" + self.name + ")...\n")
+
+        run_command(['make'] + args, stage, self.name, self.log_file, cwd)
 
     #---------------------------------------------------------------------------
 
     def install(self):
 
-        current_dir = os.getcwd()
-
         build_dir = self.source_dir + '.build'
         if os.path.isdir(build_dir): shutil.rmtree(build_dir)
 
@@ -313,67 +855,68 @@ class Package:
             inc_dir = os.path.join(self.install_dir, 'include')
             lib_dir = os.path.join(self.install_dir, 'lib')
             for dir in [inc_dir, lib_dir]:
-                if not os.path.isdir(dir):
-                    os.makedirs(dir)
+                make_dirs(dir)
 
-        # Copy source files in build directory if VPATH feature is unsupported
+        # Replicate source tree in build directory if VPATH feature
+        # is unsupported
         if self.vpath_support:
             os.makedirs(build_dir)
         else:
-            shutil.copytree(self.source_dir, build_dir)
-        os.chdir(build_dir)
+            clone_tree(self.source_dir, build_dir)
 
         configure = os.path.join(self.source_dir, 'configure')
         if os.path.isfile(configure):
 
             # Set command line for configure pass
 
+            configure = [configure]
             if self.install_dir:
-                configure = configure + ' --prefix=' + self.install_dir
-            configure = configure + ' ' + self.config_opts
+                configure.append('--prefix=' + self.install_dir)
+            configure += self.config_opts
 
             # Add compilers
-            if self.cxx: configure += ' CXX=\"' + self.cxx + '\"'
-            if self.cc: configure += ' CC=\"' + self.cc + '\"'
-            if self.fc: configure += ' FC=\"' + self.fc + '\"'
+            if self.cxx: configure.append('CXX=' + self.cxx)
+            if self.cc: configure.append('CC=' + self.cc)
+            if self.fc: configure.append('FC=' + self.fc)
 
             # Install the package and clean build directory
-            run_command(configure, "Configure", self.name, self.log_file)
-            run_command("make", "Compile", self.name, self.log_file)
-            run_command("make install", "Install", self.name, self.log_file)
-            run_command("make clean", "Clean", self.name, self.log_file)
+            run_command(configure, "Configure", self.name, self.log_file,
+                        build_dir)
+            self.run_make([], "Compile", build_dir)
+            run_command(['make', 'install'], "Install", self.name,
+                        self.log_file, build_dir)
+            run_command(['make', 'clean'], "Clean", self.name, self.log_file,
+                        build_dir)
 
         elif os.path.isfile(os.path.join(self.source_dir, 'CMakeLists.txt')):
 
             # Set command line for CMake pass
 
-            cmake = 'cmake'
+            cmake = ['cmake']
             if self.install_dir:
-                cmake += ' -DCMAKE_INSTALL_PREFIX=' + self.install_dir
-            cmake += ' ' + self.config_opts
+                cmake.append('-DCMAKE_INSTALL_PREFIX=' + self.install_dir)
+            cmake += self.config_opts
 
             # Add compilers
-            if self.cxx: cmake += ' -DCMAKE_CXX_COMPILER=\"' + self.cxx + '\"'
-            if self.cc: cmake += ' -DCMAKE_C_COMPILER=\"' + self.cc + '\"'
-            if self.fc: cmake += ' -DCMAKE_Fortran_COMPILER=\"' + self.fc + '\"'
+            if self.cxx: cmake.append('-DCMAKE_CXX_COMPILER=' + self.cxx)
+            if self.cc: cmake.append('-DCMAKE_C_COMPILER=' + self.cc)
+            if self.fc: cmake.append('-DCMAKE_Fortran_COMPILER=' + self.fc)
 
-            cmake += ' ' + self.source_dir
+            cmake.append(self.source_dir)
 
             # Install the package and clean build directory
-            run_command(cmake, "Configure", self.name, self.log_file)
-            run_command("make VERBOSE=1", "Compile", self.name, self.log_file)
-            run_command("make install VERBOSE=1", "Install", self.name, self.log_file)
-            run_command("make clean", "Clean", self.name, self.log_file)
-
-        # End of installation
-        os.chdir(current_dir)
+            run_command(cmake, "Configure", self.name, self.log_file,
+                        build_dir)
+            self.run_make(['VERBOSE=1'], "Compile", build_dir)
+            run_command(['make', 'install', 'VERBOSE=1'], "Install", self.name,
+                        self.log_file, build_dir)
+            run_command(['make', 'clean'], "Clean", self.name, self.log_file,
+                        build_dir)
 
     #---------------------------------------------------------------------------
 
     def install_ptscotch(self):
 
-        current_dir = os.getcwd()
-
         build_dir = self.source_dir + '.build'
         if os.path.isdir(build_dir): shutil.rmtree(build_dir)
 
@@ -382,19 +925,19 @@ class Package:
             inc_dir = os.path.join(self.install_dir, 'include')
             lib_dir = os.path.join(self.install_dir, 'lib')
             for dir in [inc_dir, lib_dir]:
-                if not os.path.isdir(dir):
-                    os.makedirs(dir)
+                make_dirs(dir)
 
-        # Copy source files in build directory as VPATH feature is unsupported
-        shutil.copytree(self.source_dir, build_dir)
+        # Replicate source tree in build directory as VPATH feature
+        # is unsupported
+        clone_tree(self.source_dir, build_dir)
 
-        os.chdir(os.path.join(build_dir, 'src'))
+        src_dir = os.path.join(build_dir, 'src')
 
         # Work around Ubuntu Metis build bug
         ldflags_add = ''
         try:
-            p = subprocess.Popen(self.cc + ' -Xlinker --help',
-                                 shell=True,
+            cmd = shlex.split(self.cc) + ['-Xlinker', '--help']
+            p = subprocess.Popen(cmd,
                                  universal_newlines=True,
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE)
@@ -405,74 +948,73 @@ class Package:
             pass
 
         if self.shared:
-            fdr = open('Make.inc/Makefile.inc.x86-64_pc_linux2.shlib')
+            makefile_ref = os.path.join(src_dir, 'Make.inc',
+                                        'Makefile.inc.x86-64_pc_linux2.shlib')
         else:
-            fdr = open('Make.inc/Makefile.inc.x86-64_pc_linux2')
-        fd = open('Makefile.inc','w')
+            makefile_ref = os.path.join(src_dir, 'Make.inc',
+                                        'Makefile.inc.x86-64_pc_linux2')
+        # Replace (rather than overwrite) a possibly linked file
+        makefile_inc = os.path.join(src_dir, 'Makefile.inc')
+        if os.path.exists(makefile_inc):
+            os.remove(makefile_inc)
 
         re_thread = re.compile('-DSCOTCH_PTHREAD')
         re_intsize32 = re.compile('-DINTSIZE32')
         re_intsize64 = re.compile('-DINTSIZE64')
         re_idxsize64 = re.compile('-DIDXSIZE64')
 
-        for line in fdr:
+        with open(makefile_ref) as fdr:
+            with open(makefile_inc, 'w') as fd:
 
-            if line[0:3] in ['CCS', 'CCP', 'CCD']:
-                i1 = line.find('=')
-                line = line[0:i1] + '= ' + self.cc + '\n'
-            line = re.sub(re_thread, '', line)
-            line = re.sub(re_intsize32, '', line)
-            line = re.sub(re_intsize64, '', line)
-            line = re.sub(re_idxsize64, '-DIDXSIZE64 -DINTSIZE64', line)
-            if ldflags_add and line[0:7] == 'LDFLAGS':
-                line = line[:-1] + ldflags_add
+                for line in fdr:
 
-            fd.write(line)
+                    if line[0:3] in ['CCS', 'CCP', 'CCD']:
+                        i1 = line.find('=')
+                        line = line[0:i1] + '= ' + self.cc + '\n'
+                    line = re.sub(re_thread, '', line)
+                    line = re.sub(re_intsize32, '', line)
+                    line = re.sub(re_intsize64, '', line)
+                    line = re.sub(re_idxsize64, '-DIDXSIZE64 -DINTSIZE64',
+                                  line)
+                    if ldflags_add and line[0:7] == 'LDFLAGS':
+                        line = line[:-1] + ldflags_add
 
-        fdr.close()
-        fd.close()
+                    fd.write(line)
 
         # Build and install
         for target in ['scotch', 'ptscotch']:
-            run_command("make "+target, "Compile", self.name, self.log_file)
-            run_command("make install prefix="+self.install_dir,
-                        "Install", self.name, self.log_file)
-            run_command("make clean", "Clean", self.name, self.log_file)
-
-        # End of installation
-        os.chdir(current_dir)
+            self.run_make([target], "Compile", src_dir)
+            run_command(['make', 'install', 'prefix=' + self.install_dir],
+                        "Install", self.name, self.log_file, src_dir)
+            run_command(['make', 'clean'], "Clean", self.name, self.log_file,
+                        src_dir)
 
     #---------------------------------------------------------------------------
 
     def install_parmetis(self):
 
-        current_dir = os.getcwd()
-
         build_dir = self.source_dir + '.build'
         if os.path.isdir(build_dir): shutil.rmtree(build_dir)
 
-        # Copy source files in build directory as VPATH feature is unsupported
-        shutil.copytree(self.source_dir, build_dir)
+        # Replicate source tree in build directory as VPATH feature
+        # is unsupported
+        clone_tree(self.source_dir, build_dir)
 
         for d in [os.path.join(build_dir, 'metis'), build_dir]:
 
-            os.chdir(d)
-
-            configure = "make config prefix=" + self.install_dir
-            configure += " cc=" + self.cc
+            configure = ['make', 'config', 'prefix=' + self.install_dir]
+            configure.append('cc=' + self.cc)
             if self.cxx:
-                configure += " cxx=" + self.cxx
+                configure.append('cxx=' + self.cxx)
             if self.shared:
-                configure += " shared=1 "
+                configure.append('shared=1')
 
             # Install the package and clean build directory
-            run_command(configure, "Configure", self.name, self.log_file)
-            run_command("make", "Compile", self.name, self.log_file)
-            run_command("make install", "Install", self.name, self.log_file)
-            run_command("make clean", "Clean", self.name, self.log_file)
-
-        # End of installation
-        os.chdir(current_dir)
+            run_command(configure, "Configure", self.name, self.log_file, d)
+            self.run_make([], "Compile", d)
+            run_command(['make', 'install'], "Install", self.name,
+                        self.log_file, d)
+            run_command(['make', 'clean'], "Clean", self.name, self.log_file, d)
 
     #---------------------------------------------------------------------------
 
@@ -546,6 +1088,16 @@ class Setup:
         # Logging file
         self.log_file = sys.stdout
 
+        # Maximum number of packages built simultaneously
+        self.max_workers = cpu_count()
+
+        # Lock for setup file updates
+        self.setup_lock = threading.Lock()
+
+        # Extraction completion events and status, by package
+        self.extracted = {}
+        self.extract_status = {}
+
         # Download packages
         self.download = 'yes'
 
@@ -555,6 +1107,9 @@ class Setup:
         # Code_Saturne installation with debugging symbols
         self.debug = 'no'
 
+        # Number of parallel compilation jobs (if None, number of processors)
+        self.make_jobs = None
+
         # Installation with shared libraries (not modifiable yet)
         self.shared = True
 
@@ -603,6 +1158,7 @@ class Setup:
 
         p.use = 'yes'
         p.installation = 'yes'
+        p.dependencies = list(self.optlibs)
 
         # HDF5 library
 
@@ -615,7 +1171,7 @@ class Setup:
                     url="https://support.hdfgroup.org/ftp/HDF5/releases/hdf5-1.8/hdf5-1.8.20/src/%s")
 
         p = self.packages['hdf5']
-        p.config_opts = "--enable-production"
+        p.config_opts = ['--enable-production']
 
         # CGNS library
 
@@ -628,7 +1184,8 @@ class Setup:
                     url="https://github.com/CGNS/CGNS/archive/v3.3.1.tar.gz")
 
         p = self.packages['cgns']
-        p.config_opts = "-DCGNS_ENABLE_64BIT=ON -DCGNS_ENABLE_SCOPING=ON"
+        p.config_opts = ['-DCGNS_ENABLE_64BIT=ON', '-DCGNS_ENABLE_SCOPING=ON']
+        p.dependencies = ['hdf5']
 
         # MED library
 
@@ -641,7 +1198,9 @@ class Setup:
                     url="http://files.salome-platform.org/Salome/other/%s")
 
         p = self.packages['med']
-        p.config_opts = "--with-med_int=long --disable-fortran --disable-python"
+        p.config_opts = ['--with-med_int=long', '--disable-fortran',
+                         '--disable-python']
+        p.dependencies = ['hdf5']
 
         # Libxml2 library (possible mirror at "ftp://fr.rpmfind.net/pub/libxml/%s")
 
@@ -654,7 +1213,7 @@ class Setup:
                     url="ftp://xmlsoft.org/libxml2/%s")
 
         p = self.packages['libxml2']
-        p.config_opts = "--with-ftp=no --with-http=no"
+        p.config_opts = ['--with-ftp=no', '--with-http=no']
 
         # ParMETIS
 
@@ -772,78 +1331,73 @@ to start the installation.
 
         shutil.copy('setup','setup_ini')
 
-        while 1:
-
-            line = setupFile.readline()
-            if line == '': break
-
-            # skip comments
-            if line[0] == '#': continue
-            line = line.splitlines()
-            list = line[0].split()
-            # skip blank lines
-            if len(list) == 0: continue
-
-            key = list[0]
-
-            if len(list) > 1:
-                if key == 'download': self.download = list[1]
-                elif key == 'prefix':
-                    if not list[1] in ['default', 'auto']:
-                        self.prefix = list[1]
-                elif key == 'debug': self.debug = list[1]
-                elif key == 'language': self.language = list[1]
-                elif key == 'use_arch': self.use_arch = list[1]
-                elif key == 'arch':
-                    self.arch = list[1]
-                    if self.arch == 'ignore':
-                        self.use_arch = 'no'
-                elif key == 'compCxx':
-                    if not list[1] in ['default', 'auto']:
-                        self.cxx = list[1]
-                elif key == 'compC': self.cc = list[1]
-                elif key == 'compF': self.fc = list[1]
-                elif key == 'mpiCompC':
-                    if not list[1] in ['default', 'auto']:
-                        self.mpicc = list[1]
-                elif key == 'mpiCompCxx':
-                    if not list[1] in ['default', 'auto']:
-                        self.mpicxx = list[1]
-                elif key == 'disable_gui': self.disable_gui = list[1]
-                elif key == 'disable_frontend': self.disable_frontend = list[1]
-                elif key == 'python':
-                    if not list[1] in ['default', 'auto']:
-                        self.python = list[1]
-                elif key == 'salome':
-                    if not list[1] in ['default', 'auto', 'no']:
-                        self.salome = list[1]
-                else:
+        with setupFile:
+
+            for line in setupFile:
+
+                # strip comments and skip blank lines
+                values = line.split('#', 1)[0].split()
+                if not values: continue
+
+                key = values.pop(0)
+
+                if key in setup_keywords:
+                    # keywords left blank keep their current value
+                    attr, defaults = setup_keywords[key]
+                    if values and not values[0] in defaults:
+                        setattr(self, attr, values[0])
+                elif key in self.packages:
+                    if len(values) < 2 or (values[0] != 'no'
+                                           and len(values) < 3):
+                        abort_setup("Incomplete \'%s\' library entry in "
+                                    "the setup file." % key)
                     p = self.packages[key]
-                    p.use = list[1]
-                    p.installation = list[2]
+                    p.use = values[0]
+                    p.installation = values[1]
                     if (p.use != 'no'):
-                        if list[3] != 'None':
-                            p.install_dir = list[3]
+                        if values[2] != 'None':
+                            p.install_dir = values[2]
+                else:
+                    abort_setup("Unknown \'%s\' keyword in the setup file."
+                                % key)
+
+        # Packages installed by a previous interrupted run, unless the
+        # setup file was edited since then
+        if os.path.isfile('setup.progress'):
+            if os.path.getmtime('setup.progress') < os.path.getmtime('setup'):
+                sys.stdout.write("Ignoring and removing setup.progress, "
+                                 "which is older than the setup file.\n")
+                os.remove('setup.progress')
+            else:
+                libs = []
+                with open('setup.progress', mode='r') as progressFile:
+                    for line in progressFile:
+                        fields = line.rstrip('\n').split(None, 1)
+                        if len(fields) < 2 or fields[0] not in self.packages:
+                            continue
+                        lib, install_dir = fields
+                        p = self.packages[lib]
+                        p.installation = 'no'
+                        p.install_dir = install_dir
+                        libs.append(lib)
+                if libs:
+                    sys.stdout.write("Packages installed by a previous run "
+                                     "(from setup.progress): %s\n"
+                                     % ", ".join(libs))
+
+        if self.arch == 'ignore':
+            self.use_arch = 'no'
 
         # Specify architecture name
         if self.use_arch == 'yes' and self.arch is None:
             self.arch = os.uname()[0] + '_' + os.uname()[4]
 
         # Expand user variables
-        if self.prefix:
-            self.prefix = os.path.expanduser(self.prefix)
-            self.prefix = os.path.expandvars(self.prefix)
-            self.prefix = os.path.abspath(self.prefix)
-
-        if self.python:
-            self.python = os.path.expanduser(self.python)
-            self.python = os.path.expandvars(self.python)
-            self.python = os.path.abspath(self.python)
-
-        if self.salome:
-            self.salome = os.path.expanduser(self.salome)
-            self.salome = os.path.expandvars(self.salome)
-            self.salome = os.path.abspath(self.salome)
+        for attr in ['prefix', 'python', 'salome']:
+            path = getattr(self, attr)
+            if path:
+                path = os.path.expandvars(os.path.expanduser(path))
+                setattr(self, attr, os.path.abspath(path))
 
     #---------------------------------------------------------------------------
 
@@ -857,79 +1411,43 @@ Check the setup file and some utilities presence.
         if verbose == 'yes':
             sys.stdout.write("\n")
 
-        # Testing download option
-        if self.download not in ['yes', 'no']:
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'download\' option in the setup file "
-                             "should be \'yes\' or \'no\'.\n"
-                             "Please check your setup file.\n\n")
-            sys.exit(1)
-
-        # Testing debug option
-        if self.debug not in ['yes', 'no']:
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'debug\' option in the setup file "
-                             "should be \'yes\' or \'no\'.\n"
-                             "Please check your setup file.\n\n")
-            sys.exit(1)
-
-        # Testing GUI option
-        if self.disable_gui not in ['yes', 'no']:
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'disable_gui\' option in the setup file "
-                             "should be \'yes\' or \'no\'.\n"
-                             "Please check your setup file.\n\n")
-            sys.exit(1)
-
-        # Testing frontend option
-        if self.disable_frontend not in ['yes', 'no']:
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'disable_frontend\' option in the setup file "
-                             "should be \'yes\' or \'no\'.\n"
-                             "Please check your setup file.\n\n")
-            sys.exit(1)
-
-        # Testing language option
-        if self.language not in ['en', 'fr']:
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'language\' option in the setup file "
-                             "should be \'en\' or \'fr'.\n"
-                             "Please check your setup file.\n\n")
-            sys.exit(1)
-
-        # Testing prefix directory
-        if self.prefix and not os.path.isdir(self.prefix):
+        # Testing options with a given set of values
+        for option, values in [('download', ['yes', 'no']),
+                               ('debug', ['yes', 'no']),
+                               ('disable_gui', ['yes', 'no']),
+                               ('disable_frontend', ['yes', 'no']),
+                               ('language', ['en', 'fr']),
+                               ('use_arch', ['yes', 'no'])]:
+            if getattr(self, option) not in values:
+                abort_setup("\'%s\' option in the setup file should be %s."
+                            % (option,
+                               " or ".join(["\'%s\'" % v for v in values])))
+
+        # Testing number of compilation jobs
+        if self.make_jobs:
             try:
-                os.makedirs(self.prefix)
-            except Exception:
-                pass
-        if self.prefix and not os.path.isdir(self.prefix):
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'%s\' prefix directory is provided in the setup "
-                             "file but is not a directory.\n"
-                             "Please check your setup file.\n\n"
-                             % self.prefix)
-            sys.exit(1)
-
-        # Testing architecture option
-        if self.use_arch not in ['yes', 'no']:
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'use_arch\' option in the setup file "
-                             "should be \'yes\' or \'no\'.\n"
-                             "Please check your setup file.\n\n")
-            sys.exit(1)
+                make_jobs = int(self.make_jobs)
+            except ValueError:
+                make_jobs = 0
+            if make_jobs < 1:
+                abort_setup("\'make_jobs\' option in the setup file "
+                            "should be \'auto\' or a positive integer.")
+
+        # Testing prefix directory (created if not present)
+        if self.prefix:
+            try:
+                make_dirs(self.prefix)
+            except OSError:
+                abort_setup("\'%s\' prefix directory is provided in the "
+                            "setup file but is not a directory." % self.prefix)
 
         # Looking for compilers provided by the user
         for compiler in [self.cc, self.mpicc, self.fc]:
             if compiler:
                 ret = run_test(compiler)
                 if ret != 0:
-                    sys.stderr.write("\n*** Aborting installation:\n"
-                                     "\'%s\' compiler is provided in the setup "
-                                     "file but cannot be found.\n"
-                                     "Please check your setup file.\n\n"
-                                     % compiler)
-                    sys.exit(1)
+                    abort_setup("\'%s\' compiler is provided in the setup "
+                                "file but cannot be found." % compiler)
 
         # Looking for Python executable provided by the user
         python = 'python'
@@ -937,22 +1455,17 @@ Check the setup file and some utilities presence.
         ret = run_test(python)
         if ret != 0:
             if self.python:
-                sys.stderr.write("\n*** Aborting installation:\n"
-                                 "\'%s\' Python exec is provided in the setup "
-                                 "file doesn't not seem to be executable.\n"
-                                 "Please check your setup file.\n\n"
-                                 % self.python)
+                abort_setup("\'%s\' Python exec is provided in the setup "
+                            "file doesn't not seem to be executable."
+                            % self.python)
             else:
-                sys.stderr.write("\n*** Aborting installation:\n"
-                                 "Cannot find Python executable.\n"
-                                 "Please check your setup file.\n\n")
-            sys.exit(1)
+                abort_setup("Cannot find Python executable.")
         else:
-            cmd = python + " -c \'import sys; print(sys.version[:3])\'"
+            cmd = [python, '-c',
+                   'import sys; print("%d.%d" % sys.version_info[:2])']
             if verbose == 'yes':
                 sys.stdout.write("     Python version is ")
             p = subprocess.Popen(cmd,
-                                 shell=True,
                                  universal_newlines=True,
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.STDOUT)
@@ -966,47 +1479,40 @@ Check the setup file and some utilities presence.
         for lib in self.optlibs:
             p = self.packages[lib]
             if p.use not in ['yes', 'no', 'auto']:
-                sys.stderr.write("\n*** Aborting installation:\n"
-                                 "\'%s\' use option in the setup file "
-                                 "should be \'yes\', \'no' or \'auto\'.\n"
-                                 "Please check your setup file.\n\n"
-                                 % lib)
-                sys.exit(1)
-            if p.installation not in ['yes', 'no']:
-                sys.stderr.write("\n*** Aborting installation:\n"
-                                 "\'%s\' install option in the setup file "
-                                 "should be \'yes\' or \'no'.\n"
-                                 "Please check your setup file.\n\n"
-                                 % lib)
-                sys.exit(1)
+                abort_setup("\'%s\' use option in the setup file "
+                            "should be \'yes\', \'no' or \'auto\'." % lib)
+            if p.installation not in ['yes', 'no', 'force']:
+                abort_setup("\'%s\' install option in the setup file "
+                            "should be \'yes\', \'no\' or \'force\'."
+                            % lib)
+
+        # Looking for directories provided by the user (libraries and SALOME)
+        dirs = []
+        for lib in self.optlibs:
+            p = self.packages[lib]
             if p.installation == 'no' and p.use == 'yes':
-                if not os.path.isdir(p.install_dir):
-                    sys.stderr.write("\n*** Aborting installation:\n"
-                                     "\'%(path)s\' path is provided for "
-                                     "\'%(lib)s\' in the setup "
-                                     "file but is not a directory.\n"
-                                     "Please check your setup file.\n\n"
-                                     % {'path':p.install_dir, 'lib':lib})
-                    sys.exit(1)
-
-        # Looking for SALOME path probided by the user
-        if self.salome and not os.path.isdir(self.salome):
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'%s\' SALOME directory is provided in the setup "
-                             "file but is not present.\n"
-                             "Please check your setup file.\n\n"
-                             % self.salome)
-            sys.exit(1)
-
+                dirs.append((lib, p.install_dir))
+        if self.salome:
+            dirs.append(('SALOME', self.salome))
+
+        # (each distinct path is checked only once)
+        checked = set()
+        for name, path in dirs:
+            if path in checked:
+                continue
+            checked.add(path)
+            if not path or not os.path.isdir(path):
+                abort_setup("\'%(path)s\' path is provided for "
+                            "\'%(name)s\' in the setup "
+                            "file but is not a directory."
+                            % {'path':path, 'name':name})
 
         # Looking for make utility
         ret = run_test("make")
         if ret != 0:
-            sys.stderr.write("\n*** Aborting installation:\n"
-                             "\'make\' utility is mandatory for Code_Saturne "
-                             "compilation.\n"
-                             "Please install development tools.\n\n")
-            sys.exit(1)
+            abort_setup("\'make\' utility is mandatory for Code_Saturne "
+                        "compilation.",
+                        "Please install development tools.")
 
         if verbose == 'yes':
             sys.stdout.write("\n")
@@ -1015,175 +1521,368 @@ Check the setup file and some utilities presence.
 
     def update_package_opts(self):
 
+        if self.make_jobs:
+            make_jobs = int(self.make_jobs)
+        else:
+            make_jobs = cpu_count()
+
+        # Architecture subdirectory, common to all packages
+        prefix = self.prefix
+        arch_subdir = None
+        if self.arch:
+            arch_subdir = os.path.join('arch', self.arch)
+
+        packages = self.packages
+        cc, cxx = self.cc, self.cxx
+        mpicc, mpicxx = self.mpicc, self.mpicxx
+
         # Update log file, installation directory and compilers
         for lib in self.optlibs + ['code_saturne']:
-            p = self.packages[lib]
+            p = packages[lib]
             # Update logging file
             p.log_file = self.log_file
             # Installation directory
-            if p.installation == 'yes' and not p.install_dir:
-                subdir = os.path.join(p.package + '-' + p.version)
-                if self.arch:
-                    subdir = os.path.join(subdir, 'arch', self.arch)
-                p.install_dir = os.path.join(self.prefix, subdir)
+            if p.installation in ['yes', 'force'] and not p.install_dir:
+                p.install_dir = os.path.join(prefix, p.package + '-' + p.version)
+                if arch_subdir:
+                    p.install_dir = os.path.join(p.install_dir, arch_subdir)
             # Compilers
-            p.cc = self.cc
-            p.cxx = self.cxx
-            if lib in ['scotch'] and self.mpicc:
-                p.cc = self.mpicc
-            elif lib in ['code_saturne', 'parmetis']:
-                if self.mpicc:
-                    p.cc = self.mpicc
-                if self.mpicxx:
-                    p.cxx = self.mpicxx
-            if lib in ['code_saturne']:
+            p.cc = cc
+            p.cxx = cxx
+            if lib == 'scotch' and mpicc:
+                p.cc = mpicc
+            elif lib in ('code_saturne', 'parmetis'):
+                if mpicc:
+                    p.cc = mpicc
+                if mpicxx:
+                    p.cxx = mpicxx
+            if lib == 'code_saturne':
                 p.fc = self.fc
             p.shared = self.shared
+            p.make_jobs = make_jobs
 
         # Update configuration options
 
-        config_opts = ''
+        config_opts = []
         if self.debug == 'yes':
-            config_opts = config_opts + " --enable-debug"
+            config_opts.append("--enable-debug")
 
-        hdf5 = self.packages['hdf5']
-        cgns = self.packages['cgns']
-        med= self.packages['med']
-        scotch = self.packages['scotch']
-        parmetis = self.packages['parmetis']
-        libxml2 = self.packages['libxml2']
+        hdf5 = packages['hdf5']
+        cgns = packages['cgns']
+        med = packages['med']
+        scotch = packages['scotch']
+        parmetis = packages['parmetis']
+        libxml2 = packages['libxml2']
 
         # Disable GUI
 
         if self.disable_gui == 'yes':
-            config_opts = config_opts + " --disable-gui"
+            config_opts.append("--disable-gui")
 
         # Disable frontend
 
         if self.disable_frontend == 'yes':
-            config_opts = config_opts + " --disable-frontend"
+            config_opts.append("--disable-frontend")
 
         # HDF5 (needed for MED and recommended for CGNS)
 
         if hdf5.use == 'no':
-            config_opts = config_opts + " --without-hdf5"
+            config_opts.append("--without-hdf5")
         else:
-            cgns.config_opts += " -DCGNS_ENABLE_HDF5=ON"
-            if hdf5.install_dir:
-                config_opts = config_opts + " --with-hdf5=" + hdf5.install_dir
-                med.config_opts += " --with-hdf5=" + hdf5.install_dir
-                cgns.config_opts += "-DCMAKE_PREFIX_PATH=" + hdf5.install_dir \
-                    + " -DHDF5_INCLUDE_PATH=" + hdf5.install_dir + "/include"
+            cgns.config_opts.append("-DCGNS_ENABLE_HDF5=ON")
+            hdf5_dir = hdf5.install_dir
+            if hdf5_dir:
+                with_hdf5 = "--with-hdf5=" + hdf5_dir
+                config_opts.append(with_hdf5)
+                med.config_opts.append(with_hdf5)
+                cgns.config_opts += ["-DCMAKE_PREFIX_PATH=" + hdf5_dir,
+                                     "-DHDF5_INCLUDE_PATH="
+                                     + os.path.join(hdf5_dir, "include")]
 
         # CGNS
 
         if cgns.use == 'no':
-            config_opts = config_opts + " --without-cgns"
+            config_opts.append("--without-cgns")
         else:
             if cgns.install_dir:
-                config_opts = config_opts + " --with-cgns=" + cgns.install_dir
+                config_opts.append("--with-cgns=" + cgns.install_dir)
 
         # MED
 
         if med.use == 'no':
-            config_opts = config_opts + " --without-med"
+            config_opts.append("--without-med")
         else:
             if med.install_dir:
-                config_opts = config_opts + " --with-med=" + med.install_dir
+                config_opts.append("--with-med=" + med.install_dir)
 
         # ParMetis
 
         if parmetis.use == 'no':
-            config_opts = config_opts + " --without-metis"
+            config_opts.append("--without-metis")
         else:
-            config_opts = config_opts + " --with-metis=" + parmetis.install_dir
+            config_opts.append("--with-metis=" + parmetis.install_dir)
 
         # PT-Scotch
 
         if scotch.use == 'no':
-            config_opts = config_opts + " --without-scotch"
+            config_opts.append("--without-scotch")
         else:
-            config_opts = config_opts + " --with-scotch=" + scotch.install_dir
+            config_opts.append("--with-scotch=" + scotch.install_dir)
 
         # Libxml2
 
         if libxml2.use == 'no':
-            config_opts = config_opts + " --without-libxml2"
+            config_opts.append("--without-libxml2")
         else:
             if libxml2.install_dir:
-                config_opts = config_opts + \
-                    " --with-libxml2=" + libxml2.install_dir
+                config_opts.append("--with-libxml2=" + libxml2.install_dir)
 
         # Python
 
         if self.python:
-            config_opts = config_opts + " PYTHON=" + self.python
+            config_opts.append("PYTHON=" + self.python)
 
         # SALOME
 
         if self.salome:
-            config_opts = config_opts + " --with-salome=" + self.salome
+            config_opts.append("--with-salome=" + self.salome)
 
         # Language
 
         if self.language == 'fr':
-            config_opts = config_opts + " --enable-french"
+            config_opts.append("--enable-french")
 
         # Build type
 
         if self.shared:
-            config_opts += " --disable-static"
+            config_opts.append("--disable-static")
         else:
-            config_opts += " --disable-shared"
+            config_opts.append("--disable-shared")
 
-        self.packages['code_saturne'].config_opts = config_opts
+        packages['code_saturne'].config_opts = config_opts
 
     #---------------------------------------------------------------------------
 
-    def install(self):
+    def download_all(self, libs, extract_queue):
+
+        # Archives are independent, so they are all downloaded concurrently,
+        # each being queued for extraction as soon as it is available.
+
+        def download(lib):
+            p = self.packages[lib]
+            if commands_abort.is_set():
+                sys.exit(1)
+            if self.download == 'yes':
+                sys.stdout.write("Download of %s\n  (%s)\n" % (p.name, p.url))
+                p.download()
+            extract_queue.put(lib)
+
+        failed = run_parallel(libs, {}, download, 8,
+                              lambda lib: terminate_commands())
+
+        for lib in failed:
+            sys.stderr.write("Download of %s failed.\n"
+                             % self.packages[lib].name)
+            self.extract_status[lib] = False
+            self.extracted[lib].set()
+
+        extract_queue.put(None)
 
-        if self.download == 'yes':
-            for lib in self.optlibs:
-                p = self.packages[lib]
-                if p.installation == 'yes':
-                    sys.stdout.write("Download of %s\n  (%s)\n" % (p.name, p.url))
-                    p.download()
+        if self.download == 'yes' and not failed:
             self.download = 'no'
-            self.write_setup()
-            sys.stdout.write("\n")
 
-        for lib in self.optlibs:
+    #---------------------------------------------------------------------------
+
+    def extract_all(self, extract_queue):
+
+        while True:
+            lib = extract_queue.get()
+            if lib is None:
+                break
             p = self.packages[lib]
-            p.info()
-            if p.installation == 'yes':
+            self.extract_status[lib] = False
+            if not commands_abort.is_set():
                 sys.stdout.write("Extract of %s\n" % p.name)
-                p.extract()
-                sys.stdout.write("Installation of %s\n" % p.name)
-                if verbose == 'yes':
-                    p.info()
-                if lib == 'scotch':
-                    p.install_ptscotch()
-                elif lib == 'parmetis':
-                    p.install_parmetis()
-                else:
-                    p.install()
-                p.installation = 'no'
-                self.write_setup()
-                if verbose == 'yes':
-                    sys.stdout.write("\n")
+                try:
+                    p.extract()
+                    self.extract_status[lib] = True
+                except SystemExit:
+                    pass
+                except Exception:
+                    traceback.print_exc()
+            self.extracted[lib].set()
 
-        p = self.packages['code_saturne']
-        p.info()
-        if p.installation == 'yes':
+    #---------------------------------------------------------------------------
+
+    def install_package(self, lib):
+
+        p = self.packages[lib]
+
+        if lib == 'code_saturne':
             p.source_dir = self.top_srcdir
-            sys.stdout.write("Installation of %s\n" % p.name)
-            if verbose == 'yes':
-                p.info()
-            p.install()
+        else:
+            self.extracted[lib].wait()
+            if not self.extract_status[lib]:
+                sys.exit(1)
+
+        sys.stdout.write("Installation of %s\n" % p.name)
+        if verbose == 'yes':
+            p.info()
+
+        # Commands write their output directly to the log, so each package
+        # uses its own log file while being built, to avoid mixing output
+        # from concurrent builds. It is appended to the main log on success.
+
+        main_log = self.log_file
+        p.log_file = open('install_saturne_' + p.package + '.log', mode='w')
+
+        try:
+            if lib == 'scotch':
+                p.install_ptscotch()
+            elif lib == 'parmetis':
+                p.install_parmetis()
+            else:
+                p.install()
+        finally:
+            p.log_file.close()
+
+        log_lock.acquire()
+        try:
+            with open(p.log_file.name) as f:
+                shutil.copyfileobj(f, main_log)
+            main_log.flush()
+        finally:
+            log_lock.release()
+        os.remove(p.log_file.name)
+        p.log_file = main_log
+
+        if lib != 'code_saturne' and p.install_dir:
+            p.write_install_stamp()
+
+        self.setup_lock.acquire()
+        try:
             p.installation = 'no'
-            self.write_setup()
-            if verbose == 'yes':
-                sys.stdout.write("\n")
+            self.write_progress(lib)
+        finally:
+            self.setup_lock.release()
+
+        sys.stdout.write("End of installation of %s\n" % p.name)
+
+    #---------------------------------------------------------------------------
+
+    def write_progress(self, lib):
+
+        # The setup file is only rewritten once all installations are done,
+        # so each installed package and its installation directory are also
+        # appended to a small progress file, folded into the setup file
+        # when it is read again in case the installation was interrupted.
+
+        line = lib + ' ' + str(self.packages[lib].install_dir) + '\n'
+
+        fd = os.open(os.path.join(os.getcwd(), "setup.progress"),
+                     os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    #---------------------------------------------------------------------------
+
+    def install(self):
+
+        packages = self.packages
+
+        libs = []
+        dependencies = {}
+        for lib in self.optlibs + ['code_saturne']:
+            p = packages[lib]
+            p.info()
+            if p.installation not in ['yes', 'force']:
+                continue
+            # Libraries already built with the same options are kept
+            # unless a rebuild is forced (Code_Saturne sources may change,
+            # so it is always rebuilt).
+            if lib != 'code_saturne' and p.installation == 'yes' \
+               and p.check_install_stamp():
+                sys.stdout.write("%s is already installed in %s\n"
+                                 "  (remove %s or set its install option "
+                                 "to 'force' to rebuild it)\n"
+                                 % (p.name, p.install_dir,
+                                    os.path.join(p.install_dir,
+                                                 '.install_stamp')))
+                p.installation = 'no'
+                continue
+            libs.append(lib)
+            dependencies[lib] = p.dependencies
+
+        # Share processors between concurrent builds, to avoid running
+        # more compilers than processors: with automatic make jobs, the
+        # processors are divided among the libraries which may be built
+        # simultaneously (Code_Saturne, always built last, uses them all);
+        # with a given number of jobs, fewer packages are built at once.
+
+        n_procs = cpu_count()
+        max_workers = self.max_workers
+        if self.make_jobs:
+            max_workers = max(1, min(max_workers,
+                                     n_procs // int(self.make_jobs)))
+        else:
+            optlibs = [lib for lib in libs if lib != 'code_saturne']
+            n_builds = max(1, min(max_workers, len(optlibs)))
+            for lib in optlibs:
+                packages[lib].make_jobs = max(1, n_procs // n_builds)
+
+        # Download, extraction and installation are pipelined: archives are
+        # downloaded and extracted by separate threads, and independent
+        # packages are built concurrently as soon as their sources and
+        # the packages they depend upon are available.
+
+        archives = [lib for lib in libs if lib != 'code_saturne']
+
+        self.extracted.clear()
+        self.extract_status.clear()
+        for lib in archives:
+            self.extracted[lib] = threading.Event()
+
+        extract_queue = queue.Queue(2)
+
+        stages = [threading.Thread(target=self.download_all,
+                                   args=(archives, extract_queue)),
+                  threading.Thread(target=self.extract_all,
+                                   args=(extract_queue,))]
+        # The first failure stops the whole installation, as does an
+        # interruption (such as Ctrl-C) of the main thread, which would
+        # otherwise leave the other threads running.
+
+        try:
+            for t in stages:
+                t.start()
+
+            failed = run_parallel(libs, dependencies, self.install_package,
+                                  max_workers,
+                                  lambda lib: terminate_commands())
+
+            for t in stages:
+                t.join()
+        except BaseException:
+            terminate_commands()
+            raise
+
+        # Record the new state (already installed packages and downloaded
+        # archives) in the setup file, which supersedes the progress file.
+
+        self.write_setup()
+        progress = os.path.join(os.getcwd(), "setup.progress")
+        if os.path.isfile(progress):
+            os.remove(progress)
+
+        if failed:
+            sys.stderr.write("\n*** Aborting installation:\n"
+                             "The following packages were not installed: "
+                             "%s.\n\n"
+                             % ", ".join([packages[lib].name
+                                          for lib in failed]))
+            sys.exit(1)
 
     #---------------------------------------------------------------------------
 
@@ -1191,134 +1890,6 @@ Check the setup file and some utilities presence.
         #
         # setup file update
         #
-        sf = open(os.path.join(os.getcwd(), "setup"), mode='w')
-
-        setupMain = \
-"""#========================================================
-# Setup file for Code_Saturne installation
-#========================================================
-#
-#--------------------------------------------------------
-# Download packages ?
-#--------------------------------------------------------
-download  %(download)s
-#
-#--------------------------------------------------------
-# Language
-#   default: "en" english
-#   others:  "fr" french
-#--------------------------------------------------------
-language  %(lang)s
-#
-#--------------------------------------------------------
-# Install Code_Saturne with debugging symbols
-#--------------------------------------------------------
-debug     %(debug)s
-#
-#--------------------------------------------------------
-# Installation directory
-#--------------------------------------------------------
-prefix    %(prefix)s
-#
-#--------------------------------------------------------
-# Optional architecture Name (installation subdirectory)
-#--------------------------------------------------------
-use_arch  %(use_arch)s
-arch      %(arch)s
-#
-#--------------------------------------------------------
-# C compiler and optional MPI wrapper
-#--------------------------------------------------------
-compC     %(cc)s
-mpiCompC  %(mpicc)s
-#
-#--------------------------------------------------------
-# Fortran compiler
-#--------------------------------------------------------
-compF    %(fc)s
-#
-#--------------------------------------------------------
-# C++ compiler and MPI wrapper for optional packages
-#
-# Required only for static builds using the MED library
-# or for build of optional modules such as MEDCoupling
-# support.
-#--------------------------------------------------------
-compCxx     %(cxx)s
-mpiCompCxx  %(mpicxx)s
-#
-#--------------------------------------------------------
-# Python interpreter.
-#--------------------------------------------------------
-python    %(python)s
-#
-#--------------------------------------------------------
-# Disable the Graphical user Interface ?
-#--------------------------------------------------------
-disable_gui  %(disable_gui)s
-#
-#--------------------------------------------------------
-# Disable frontend (also disables GUI) ?
-# May be useful for debug builds and HPC cluster builds
-# installed side-by side with a full build.
-#--------------------------------------------------------
-disable_frontend  %(disable_frontend)s
-#
-#--------------------------------------------------------
-# Optional SALOME platform install path.
-#
-# This is the path for the main SALOME directory,
-# not the application directory.
-#
-# If Code_Saturne is built with SALOME support,
-# running "code_saturne salome" will launch the
-# associated application, containing the CFDSTUDY module.
-#--------------------------------------------------------
-salome    %(salome)s
-#
-#--------------------------------------------------------
-# Optional packages:
-# ------------------
-#
-# MED / HDF5  For MED file format support
-#             (used by SALOME and by Gmsh)
-#
-# CGNS / HDF5 For CGNS file support
-#             (used by many meshing tools)
-#
-# Scotch (includes PT-Scotch) and/or ParMetis
-# for parallel partitioning
-#
-#   For Linux workstations, HDF5, CGNS, and even MED
-# packages may be available through the package manager.
-# HDF5 is also often available on large systems.
-# When building with SALOME, the platform distribution's
-# packages may be used, by setting 'salome' in the
-# matching entry under the "Use" column.
-#
-# Scotch and Pt-Scotch are available in some Linux
-# distributions, but may be built with options
-# incompatible with non-threaded Code_Saturne runs.
-#
-#   To install CGNS or ParMetis, the CMake
-# configuration/installation tool is required
-# (it is available in most Linux distributions)
-#
-#   Libxml2 is needed to read XML files output by the
-# Graphical User Interface. It is generally available
-# through the package manager.
-#--------------------------------------------------------
-#
-#  Name    Use   Install  Path
-#
-"""
-        setupLib= \
-"""%(lib)-9s  %(use)-4s  %(install)-3s      %(dir)s
-"""
-        setupEnd= \
-"""#
-#========================================================
-"""
 
         prefix = self.prefix
         arch = self.arch
@@ -1329,6 +1900,7 @@ salome    %(salome)s
         mpicxx = self.mpicxx
         python = self.python
         salome = self.salome
+        make_jobs = self.make_jobs
 
         # Clean some potentially undefined variables for output
         if not prefix: prefix = 'default'
@@ -1340,27 +1912,35 @@ salome    %(salome)s
         if not mpicxx: mpicxx = 'auto'
         if not python: python = 'NEEDS_DEFINITION'
         if not salome: salome = 'no'
-
-        sf.write(setupMain
-                 % { 'download':self.download, 'prefix':prefix,
-                     'lang':self.language, 'debug':self.debug,
-                     'use_arch':self.use_arch, 'arch':arch,
-                     'cc':cc, 'mpicc':mpicc,
-                     'fc':fc,
-                     'cxx':cxx, 'mpicxx':mpicxx,
-                     'disable_gui':self.disable_gui,
-                     'disable_frontend':self.disable_frontend,
-                     'python':self.python, 'salome':salome})
-
+        if not make_jobs: make_jobs = 'auto'
+
+        # Build the whole file contents, then write them at once
+
+        parts = [setup_main.substitute(
+                     download=self.download, prefix=prefix,
+                     lang=self.language, debug=self.debug,
+                     make_jobs=make_jobs,
+                     use_arch=self.use_arch, arch=arch,
+                     cc=cc, mpicc=mpicc,
+                     fc=fc,
+                     cxx=cxx, mpicxx=mpicxx,
+                     disable_gui=self.disable_gui,
+                     disable_frontend=self.disable_frontend,
+                     python=self.python, salome=salome)]
+
+        packages = self.packages
+        format_lib = setup_lib.format
         for lib in self.optlibs:
-            p = self.packages[lib]
-            sf.write(setupLib % {'lib':lib,
-                                 'use':p.use,
-                                 'install':p.installation,
-                                 'dir':p.install_dir})
+            p = packages[lib]
+            parts.append(format_lib(lib=lib,
+                                    use=p.use,
+                                    install=p.installation,
+                                    dir=p.install_dir))
+
+        parts.append(setup_end)
 
-        sf.write(setupEnd)
-        sf.close()
+        with open(os.path.join(os.getcwd(), "setup"), mode='w') as sf:
+            sf.write(''.join(parts))
 
 #-------------------------------------------------------------------------------
 # Main